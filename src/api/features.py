@@ -0,0 +1,22 @@
+import numpy as np
+from numba import njit
+
+# Explicit signature: the kernel is compiled when this module is imported (and written to
+# Numba's on-disk cache), so `python -c "import src.api.features"` at image build time
+# ships it precompiled and workers never JIT on startup or on the first request.
+ASSEMBLE_SIGNATURE = "float32[:, ::1](float64[:], int64[:], int64[:], int64[:], float64[:], float64[:], int64[:], float32[:], float32[:])"
+
+@njit(ASSEMBLE_SIGNATURE, cache=True, fastmath=True)
+def assemble_features(ages, gender_codes, condition_codes, drug_codes, dosages, durations, side_codes, means, scales):
+    """Assemble scaled feature rows in training column order from encoded category codes."""
+    n = ages.shape[0]
+    x = np.empty((n, 7), dtype=np.float32)
+    for i in range(n):
+        x[i, 0] = (ages[i] - means[0]) / scales[0]
+        x[i, 1] = gender_codes[i]
+        x[i, 2] = condition_codes[i]
+        x[i, 3] = drug_codes[i]
+        x[i, 4] = (dosages[i] - means[1]) / scales[1]
+        x[i, 5] = (durations[i] - means[2]) / scales[2]
+        x[i, 6] = side_codes[i]
+    return x
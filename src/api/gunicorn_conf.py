@@ -0,0 +1,10 @@
+import multiprocessing
+import os
+
+# Gunicorn settings for the inference API (one Uvicorn event loop per worker process)
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app (and load the model artifacts) once in the master before forking workers
+preload_app = True
@@ -1,16 +1,23 @@
-from fastapi import FastAPI, HTTPException, Security, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Security, Depends
 from fastapi.security.api_key import APIKeyHeader
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 import joblib
-import pandas as pd
+import numpy as np
+import xgboost as xgb
 import os
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import uvicorn
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
 from starlette.responses import Response
 import time
 import logging
 
+from src.api.features import assemble_features
+
 # Configure Logging
 logging.basicConfig(
     level=logging.INFO,
@@ -19,10 +26,13 @@ logging.basicConfig(
 logger = logging.getLogger("drug_prediction_api")
 
 # Environment variables
-MODEL_PATH = os.getenv("MODEL_PATH", "models/model.joblib")
+MODEL_PATH = os.getenv("MODEL_PATH", "models/model.ubj")
 ENCODERS_PATH = os.getenv("ENCODERS_PATH", "data/processed/encoders.pkl")
 SCALER_PATH = os.getenv("SCALER_PATH", "data/processed/scaler.pkl")
 API_KEY = os.getenv("API_KEY", "secret-token")  # Default for dev, change in prod!
+MAX_BATCH = int(os.getenv("MAX_BATCH", "32"))
+BATCH_WINDOW_S = float(os.getenv("BATCH_WINDOW_MS", "2")) / 1000
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "65536"))
 
 API_KEY_NAME = "X-API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
@@ -35,13 +45,15 @@ async def get_api_key(api_key_header: str = Security(api_key_header)):
         detail="Could not validate credentials"
     )
 
-app = FastAPI(
+# Public app: docs, health, metrics and the browser-facing /predict, behind CORS
+public_app = FastAPI(
     title="Drug Treatment Outcome Prediction API",
     description="Production-ready MLOps inference service for patient outcome prediction.",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-app.add_middleware(
+public_app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
@@ -49,15 +61,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Internal app: /v1/predict for service-to-service traffic, no middleware on the hot path
+predict_app = FastAPI(default_response_class=ORJSONResponse, docs_url=None, redoc_url=None, openapi_url=None)
+
+# Top-level ASGI app: owns startup/shutdown and routes to the two sub-apps, so CORS
+# only wraps the public routes
+app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+
+predict_router = APIRouter()
+
 # Metrics
 REQUEST_COUNT = Counter('request_count', 'Total number of requests', ['method', 'endpoint', 'status'])
 REQUEST_LATENCY = Histogram('request_latency_seconds', 'Request latency', ['endpoint'])
 
+# Feature layout expected by the model (must match training column order)
+FEATURE_ORDER = ('Age', 'Gender', 'Condition', 'Drug_Name', 'Dosage_mg', 'Treatment_Duration_days', 'Side_Effects')
+CAT_COLS = ('Gender', 'Condition', 'Drug_Name', 'Side_Effects')
+
 # Global artifacts
-model = None
+booster = None
 encoders = None
 scaler = None
 
+# Inference lookups precomputed from the artifacts at startup
+enc_maps = None
+sorted_classes = None
+sorted_codes = None
+scaler_mean = None
+scaler_scale = None
+
+# Micro-batching state (created inside the server's event loop at startup)
+predict_queue = None
+batcher_task = None
+executor = None
+pending_batches = set()
+
+# LRU of scores keyed by the (quantized) request features; the model is deterministic
+prediction_cache = OrderedDict()
+
 class PredictionRequest(BaseModel):
     Age: int
     Gender: str
@@ -71,70 +112,179 @@ class PredictionResponse(BaseModel):
     Improvement_Score: float
     Model_Version: str = "v1"
 
-@app.on_event("startup")
+def encode_batch(keys):
+    """Encode and scale a batch of request feature tuples.
+
+    Returns the (n, 7) float32 feature matrix and a mask of rows whose categories are all known.
+    """
+    columns = dict(zip(FEATURE_ORDER, zip(*keys)))
+    valid = np.ones(len(keys), dtype=bool)
+    codes = {}
+    for col in CAT_COLS:
+        # Branchless lookup over the sorted vocabulary; unknown values fail the equality check
+        classes = sorted_classes[col]
+        values = np.array(columns[col])
+        idx = np.minimum(np.searchsorted(classes, values), len(classes) - 1)
+        valid &= classes[idx] == values
+        codes[col] = sorted_codes[col][idx]
+
+    x = assemble_features(
+        np.array(columns['Age'], dtype=np.float64), codes['Gender'], codes['Condition'], codes['Drug_Name'],
+        np.array(columns['Dosage_mg'], dtype=np.float64), np.array(columns['Treatment_Duration_days'], dtype=np.float64),
+        codes['Side_Effects'], scaler_mean, scaler_scale
+    )
+    return x, valid
+
+def score_batch(keys):
+    x, valid = encode_batch(keys)
+    # C-contiguous float32 batch hits XGBoost's inplace fast path (no DMatrix)
+    return booster.inplace_predict(x), valid
+
+def unknown_category_error(key):
+    for col, value in zip(FEATURE_ORDER, key):
+        if col in enc_maps and value not in enc_maps[col]:
+            logger.warning(f"Unknown category encountered for {col}: {value}")
+            return HTTPException(status_code=400, detail=f"Unknown category for {col}: {value}")
+
+async def run_batch(items):
+    """Encode and score one batch on the model thread pool and resolve its futures."""
+    keys = [key for key, _ in items]
+    try:
+        predictions, valid = await asyncio.get_running_loop().run_in_executor(executor, score_batch, keys)
+    except Exception as e:
+        for _, future in items:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    for (key, future), prediction, known in zip(items, predictions, valid):
+        if future.done():
+            continue
+        if known:
+            future.set_result(float(prediction))
+        else:
+            future.set_exception(unknown_category_error(key))
+
+async def batch_predictor():
+    """Aggregate queued single-row requests and score them with one model call."""
+    loop = asyncio.get_running_loop()
+    while True:
+        items = [await predict_queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_S
+        while len(items) < MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(predict_queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Don't wait for the batch to finish: the next one can be collected while
+        # this one runs, up to the executor's worker count in parallel
+        task = asyncio.create_task(run_batch(items))
+        pending_batches.add(task)
+        task.add_done_callback(pending_batches.discard)
+
 def load_artifacts():
-    global model, encoders, scaler
+    global booster, encoders, scaler, enc_maps, sorted_classes, sorted_codes, scaler_mean, scaler_scale
     try:
         logger.info("Loading model artifacts...")
-        model = joblib.load(MODEL_PATH)
+        booster = xgb.Booster(model_file=MODEL_PATH)
+        # One OpenMP thread per prediction: batches run in parallel on the executor
+        # threads instead (inplace_predict releases the GIL during traversal)
+        booster.set_param({'nthread': 1, 'device': 'cpu'})
         encoders = joblib.load(ENCODERS_PATH)
         scaler = joblib.load(SCALER_PATH)
+
+        # Encoders are plain {category: code} dicts; float32 arrays avoid sklearn on the hot path
+        enc_maps = encoders
+        sorted_classes = {}
+        sorted_codes = {}
+        for col, mapping in enc_maps.items():
+            classes = np.array(list(mapping.keys()))
+            order = np.argsort(classes)
+            sorted_classes[col] = classes[order]
+            sorted_codes[col] = np.array(list(mapping.values()), dtype=np.int64)[order]
+        scaler_mean = scaler.mean_.astype(np.float32)
+        scaler_scale = scaler.scale_.astype(np.float32)
+
+        prediction_cache.clear()
         logger.info("Artifacts loaded successfully.")
     except Exception as e:
         logger.error(f"Failed to load artifacts: {e}")
         # In production, we might want to crash if artifacts fail
         # raise e
 
-@app.get("/health")
+# Loaded at import time so that `gunicorn --preload` reads the artifacts once in the
+# master process and the forked workers share those pages copy-on-write
+load_artifacts()
+
+@app.on_event("startup")
+async def start_batcher():
+    # Per worker: threads, queues and tasks must not be created before the fork
+    global predict_queue, batcher_task, executor
+    executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+    predict_queue = asyncio.Queue()
+    batcher_task = asyncio.create_task(batch_predictor())
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    if batcher_task is not None:
+        batcher_task.cancel()
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+@public_app.get("/health")
 def health_check():
-    if model is None:
+    if booster is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     return {"status": "healthy", "service": "drug-prediction-api"}
 
-@app.get("/metrics")
+@public_app.get("/metrics")
 def metrics():
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
-@app.post("/predict", response_model=PredictionResponse, dependencies=[Depends(get_api_key)])
-def predict(request: PredictionRequest):
+async def compute_score(key):
+    """Score one request feature tuple via the micro-batcher (encoding happens per batch)."""
+    future = asyncio.get_running_loop().create_future()
+    predict_queue.put_nowait((key, future))
+    return await future
+
+# PredictionResponse only documents the payload; the handler returns a ready-made ORJSONResponse
+# so FastAPI skips the extra response_model validation pass
+@predict_router.post("/predict", responses={200: {"model": PredictionResponse}}, dependencies=[Depends(get_api_key)])
+async def predict(request: PredictionRequest):
     start_time = time.time()
     
-    if not model or not encoders or not scaler:
+    if booster is None or not enc_maps or scaler_mean is None:
         logger.error("Model not initialized")
         REQUEST_COUNT.labels(method='POST', endpoint='/predict', status='503').inc()
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
         logger.info(f"Received prediction request for Patient Age: {request.Age}, Drug: {request.Drug_Name}")
-        data = request.dict()
-        df = pd.DataFrame([data])
         
-        # Preprocessing
-        for col, le in encoders.items():
-            if col in df.columns:
-                try:
-                    df[col] = le.transform(df[col])
-                except ValueError:
-                    logger.warning(f"Unknown category encountered for {col}: {data[col]}")
-                    raise HTTPException(status_code=400, detail=f"Unknown category for {col}: {data[col]}")
-
-        # Scaling
-        num_cols = ['Age', 'Dosage_mg', 'Treatment_Duration_days']
-        df[num_cols] = scaler.transform(df[num_cols])
-        
-        # Ensure column order matches training
-        expected_cols = ['Age', 'Gender', 'Condition', 'Drug_Name', 'Dosage_mg', 'Treatment_Duration_days', 'Side_Effects']
-        df = df[expected_cols]
-        
-        prediction = model.predict(df)
-        score = float(prediction[0])
+        # Dosage is quantized to 0.1 mg so near-identical requests share a cache entry
+        key = (
+            request.Age, request.Gender, request.Condition, request.Drug_Name,
+            round(request.Dosage_mg, 1), request.Treatment_Duration_days, request.Side_Effects
+        )
+        score = prediction_cache.get(key)
+        if score is not None:
+            prediction_cache.move_to_end(key)
+        else:
+            score = await compute_score(key)
+            prediction_cache[key] = score
+            if len(prediction_cache) > PREDICTION_CACHE_SIZE:
+                prediction_cache.popitem(last=False)
         
         latency = time.time() - start_time
         REQUEST_LATENCY.labels(endpoint='/predict').observe(latency)
         REQUEST_COUNT.labels(method='POST', endpoint='/predict', status='200').inc()
         
         logger.info(f"Prediction success. Score: {score}")
-        return {"Improvement_Score": score}
+        return ORJSONResponse({"Improvement_Score": score, "Model_Version": "v1"})
         
     except HTTPException as he:
         raise he
@@ -143,5 +293,11 @@ def predict(request: PredictionRequest):
         REQUEST_COUNT.labels(method='POST', endpoint='/predict', status='500').inc()
         raise HTTPException(status_code=500, detail="Internal server error")
 
+public_app.include_router(predict_router)
+predict_app.include_router(predict_router)
+
+app.mount("/v1", predict_app)
+app.mount("/", public_app)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,57 +1,69 @@
-import pandas as pd
-import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder, StandardScaler
+import polars as pl
+from sklearn.preprocessing import StandardScaler
 import joblib
+import math
 import os
 import argparse
 
 def preprocess(input_path, output_dir):
     os.makedirs(output_dir, exist_ok=True)
     
-    # Load dataset
-    df = pd.read_csv(input_path)
+    # Lazily scan the dataset; Polars fuses the steps below and runs them multithreaded
+    lf = pl.scan_csv(input_path)
     
     # Drop Patient_ID as it's not a predictive feature
-    if 'Patient_ID' in df.columns:
-        df = df.drop(columns=['Patient_ID'])
+    if 'Patient_ID' in lf.collect_schema().names():
+        lf = lf.drop('Patient_ID')
         
     # Categorical columns to encode
-    cat_cols = ['Gender', 'Condition', 'Drug_Name', 'Side_Effects']
-    encoders = {}
+    schema = lf.collect_schema().names()
+    cat_cols = [col for col in ['Gender', 'Condition', 'Drug_Name', 'Side_Effects'] if col in schema]
     
-    for col in cat_cols:
-        if col in df.columns:
-            le = LabelEncoder()
-            df[col] = le.fit_transform(df[col].astype(str))
-            encoders[col] = le
+    # Empty fields come back as null; keep them as their own '' category
+    lf = lf.with_columns([pl.col(col).fill_null('') for col in cat_cols])
+    
+    # Category -> code mapping in first-appearance order, all columns in one pass
+    vocab = lf.select([pl.col(col).unique(maintain_order=True).implode() for col in cat_cols]).collect(engine='streaming')
+    encoders = {col: {v: i for i, v in enumerate(vocab[col][0])} for col in cat_cols}
             
-    # Save encoders for inference usage
+    # Save encoder mappings for inference usage
     joblib.dump(encoders, os.path.join(output_dir, 'encoders.pkl'))
     
-    # Split features and target
-    target = 'Improvement_Score'
-    X = df.drop(columns=[target])
-    y = df[target]
+    # Encode categories as int8 codes (int16 for large vocabularies)
+    df = lf.with_columns([
+        pl.col(col).cast(pl.Enum(list(encoders[col]))).to_physical().cast(pl.Int8 if len(encoders[col]) <= 128 else pl.Int16)
+        for col in cat_cols
+    ]).collect(engine='streaming')
     
-    # Train test split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Train test split (seeded shuffle, 20% test)
+    df = df.sample(fraction=1.0, shuffle=True, seed=42)
+    n_test = math.ceil(df.height * 0.2)
+    test, train = df.head(n_test), df.tail(df.height - n_test)
     
     # Scale numerical features (optional but good practice)
-    # Identifying numerical columns that are not the encoded ones
     # In this dataset: Age, Dosage_mg, Treatment_Duration_days
     num_cols = ['Age', 'Dosage_mg', 'Treatment_Duration_days']
     scaler = StandardScaler()
-    X_train[num_cols] = scaler.fit_transform(X_train[num_cols])
-    X_test[num_cols] = scaler.transform(X_test[num_cols])
+    scaler.fit(train.select(num_cols).to_numpy())
     
     joblib.dump(scaler, os.path.join(output_dir, 'scaler.pkl'))
     
+    scaled = [
+        ((pl.col(col) - mean) / scale).cast(pl.Float32)
+        for col, mean, scale in zip(num_cols, scaler.mean_, scaler.scale_)
+    ]
+    train = train.with_columns(scaled)
+    test = test.with_columns(scaled)
+    
+    # Split features and target
+    target = 'Improvement_Score'
+    feature_cols = [col for col in df.columns if col != target]
+    
     # Save processed data
-    X_train.to_csv(os.path.join(output_dir, 'X_train.csv'), index=False)
-    X_test.to_csv(os.path.join(output_dir, 'X_test.csv'), index=False)
-    y_train.to_csv(os.path.join(output_dir, 'y_train.csv'), index=False)
-    y_test.to_csv(os.path.join(output_dir, 'y_test.csv'), index=False)
+    train.select(feature_cols).write_parquet(os.path.join(output_dir, 'X_train.parquet'), compression='zstd')
+    test.select(feature_cols).write_parquet(os.path.join(output_dir, 'X_test.parquet'), compression='zstd')
+    train.select(target).write_parquet(os.path.join(output_dir, 'y_train.parquet'), compression='zstd')
+    test.select(target).write_parquet(os.path.join(output_dir, 'y_test.parquet'), compression='zstd')
     
     print(f"Preprocessing completed. Artifacts saved to {output_dir}")
 
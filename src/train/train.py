@@ -1,34 +1,48 @@
 import pandas as pd
 import xgboost as xgb
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
-import joblib
 import json
 import os
 import argparse
 import numpy as np
 
-def train(data_dir, model_dir, metrics_file):
+def train(data_dir, model_dir, metrics_file, device='cpu'):
     os.makedirs(model_dir, exist_ok=True)
     
     # Load data
-    X_train = pd.read_csv(os.path.join(data_dir, 'X_train.csv'))
-    y_train = pd.read_csv(os.path.join(data_dir, 'y_train.csv'))
-    X_test = pd.read_csv(os.path.join(data_dir, 'X_test.csv'))
-    y_test = pd.read_csv(os.path.join(data_dir, 'y_test.csv'))
+    X_train = pd.read_parquet(os.path.join(data_dir, 'X_train.parquet'))
+    y_train = pd.read_parquet(os.path.join(data_dir, 'y_train.parquet'))
+    X_test = pd.read_parquet(os.path.join(data_dir, 'X_test.parquet'))
+    y_test = pd.read_parquet(os.path.join(data_dir, 'y_test.parquet'))
     
-    # Train model
+    # Encoded categoricals get XGBoost's native partition-based splits
+    cat_cols = ['Gender', 'Condition', 'Drug_Name', 'Side_Effects']
+    feature_types = ['c' if col in cat_cols else 'q' for col in X_train.columns]
+    
+    # Train model (histogram-based split finding, all cores / optional GPU)
     model = xgb.XGBRegressor(
         objective='reg:squarederror',
         n_estimators=100,
         learning_rate=0.1,
         max_depth=5,
+        tree_method='hist',
+        max_bin=256,
+        enable_categorical=True,
+        feature_types=feature_types,
+        device=device,
+        n_jobs=os.cpu_count(),
         random_state=42
     )
     
-    model.fit(X_train, y_train)
+    # Column-major float32 buffers match XGBoost's per-feature access and avoid
+    # an extra conversion copy from the pandas blocks
+    X_train_np = np.asfortranarray(X_train.to_numpy(dtype=np.float32))
+    y_train_np = y_train.to_numpy(dtype=np.float32)
+    model.fit(X_train_np, y_train_np)
+    model.get_booster().feature_names = list(X_train.columns)
     
     # Evaluate
-    predictions = model.predict(X_test)
+    predictions = model.predict(X_test.to_numpy(dtype=np.float32))
     mse = mean_squared_error(y_test, predictions)
     mae = mean_absolute_error(y_test, predictions)
     r2 = r2_score(y_test, predictions)
@@ -45,15 +59,17 @@ def train(data_dir, model_dir, metrics_file):
     with open(metrics_file, 'w') as f:
         json.dump(metrics, f, indent=4)
         
-    # Save model
-    joblib.dump(model, os.path.join(model_dir, 'model.joblib'))
-    print(f"Model saved to {os.path.join(model_dir, 'model.joblib')}")
+    # Save model (native UBJSON booster format, loaded directly by the API)
+    model_path = os.path.join(model_dir, 'model.ubj')
+    model.get_booster().save_model(model_path)
+    print(f"Model saved to {model_path}")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--data', type=str, required=True, help="Directory containing preprocessed data")
     parser.add_argument('--model-dir', type=str, required=True, help="Directory to save the model")
     parser.add_argument('--metrics', type=str, required=True, help="Path to save metrics JSON")
+    parser.add_argument('--device', type=str, default='cpu', help="XGBoost device, e.g. 'cpu' or 'cuda'")
     args = parser.parse_args()
     
-    train(args.data, args.model_dir, args.metrics)
+    train(args.data, args.model_dir, args.metrics, args.device)